@@ -1,11 +1,16 @@
 # employee_leave_server.py
 from mcp.server.fastmcp import FastMCP
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, FrozenSet
 from datetime import datetime, date
 from enum import Enum
+from contextlib import contextmanager
+from collections import namedtuple
+from functools import lru_cache
 import json
+import re
 import sqlite3
+import queue
 import os
 
 # Create MCP server
@@ -13,6 +18,18 @@ mcp = FastMCP("Employee & Leave Management System")
 
 # Database configuration
 DB_FILE = "employee_leave.db"
+POOL_SIZE = 4
+
+# Applied to every connection; WAL lets readers run alongside a writer and
+# foreign_keys makes SQLite enforce the schema's REFERENCES clauses
+SQLITE_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
 
 # Data Models
 class EmployeeStatus(str, Enum):
@@ -34,6 +51,36 @@ class LeaveStatus(str, Enum):
     REJECTED = "rejected"
     CANCELLED = "cancelled"
 
+# Dates already in canonical YYYY-MM-DD form can take the fromisoformat fast path
+_CANONICAL_DATE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+# Precomputed for validation and error messages in the tools
+_EMPLOYEE_STATUS_VALUES = frozenset(s.value for s in EmployeeStatus)
+_EMPLOYEE_STATUS_CHOICES = str([s.value for s in EmployeeStatus])
+_LEAVE_TYPE_VALUES = frozenset(lt.value for lt in LeaveType)
+_LEAVE_TYPE_CHOICES = str([lt.value for lt in LeaveType])
+
+# Columns update_employee may change, in SET-clause order
+EMPLOYEE_UPDATE_FIELDS = ("first_name", "last_name", "email", "department", "position", "status", "manager_id")
+
+# Shared by approve/reject so sqlite3's statement cache reuses one prepared statement.
+# Only pending requests with an existing approver can be decided.
+DECIDE_LEAVE_REQUEST_SQL = '''
+    UPDATE leave_requests
+    SET status = ?, approved_by = ?, approved_date = ?, comments = ?
+    WHERE id = ? AND status = ?
+      AND EXISTS (SELECT 1 FROM employees WHERE id = ?)
+    RETURNING *
+'''
+
+# Only annual and sick leave track a balance
+DEDUCT_LEAVE_BALANCE_SQL = '''
+    UPDATE employees
+    SET annual_leave_balance = annual_leave_balance - CASE WHEN :leave_type = 'annual' THEN :days ELSE 0 END,
+        sick_leave_balance = sick_leave_balance - CASE WHEN :leave_type = 'sick' THEN :days ELSE 0 END
+    WHERE id = :employee_id
+'''
+
 class Employee(BaseModel):
     id: int
     first_name: str
@@ -62,19 +109,20 @@ class LeaveRequest(BaseModel):
     comments: Optional[str] = None
 
 # Database setup
-def init_database():
-    """Initialize the SQLite database with required tables"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Create employees table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employees (
+def apply_pragmas(conn: sqlite3.Connection):
+    """Apply the connection-level SQLite settings"""
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+
+def create_employees_table(cursor: sqlite3.Cursor, table_name: str = "employees"):
+    """Create the employees table (under another name when rebuilding it)"""
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             first_name TEXT NOT NULL,
             last_name TEXT NOT NULL,
             email TEXT UNIQUE NOT NULL,
-            department TEXT NOT NULL,
+            department TEXT NOT NULL COLLATE NOCASE,
             position TEXT NOT NULL,
             hire_date DATE NOT NULL,
             status TEXT DEFAULT 'active',
@@ -84,6 +132,38 @@ def init_database():
             FOREIGN KEY (manager_id) REFERENCES employees (id)
         )
     ''')
+
+def migrate_department_collation(conn: sqlite3.Connection):
+    """One-shot migration for databases created before department was COLLATE NOCASE.
+
+    SQLite's ALTER TABLE can't change a column's collation, so the employees
+    table is rebuilt under the new schema and swapped in. Its indexes are
+    dropped with the old table and recreated by init_database.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'employees'")
+    if "COLLATE NOCASE" in cursor.fetchone()[0]:
+        return
+    
+    # Dropping employees would otherwise trip leave_requests' foreign keys
+    conn.execute("PRAGMA foreign_keys=OFF")
+    cursor.execute("BEGIN")
+    create_employees_table(cursor, "employees_new")
+    cursor.execute("INSERT INTO employees_new SELECT * FROM employees")
+    cursor.execute("DROP TABLE employees")
+    cursor.execute("ALTER TABLE employees_new RENAME TO employees")
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys=ON")
+
+def init_database():
+    """Initialize the SQLite database with required tables"""
+    conn = sqlite3.connect(DB_FILE)
+    apply_pragmas(conn)
+    cursor = conn.cursor()
+    
+    # Create employees table
+    create_employees_table(cursor)
+    migrate_department_collation(conn)
     
     # Create leave_requests table
     cursor.execute('''
@@ -105,40 +185,84 @@ def init_database():
         )
     ''')
     
+    # Index foreign keys and the columns the list tools filter and sort on
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_dept ON employees(department)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_status ON employees(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_emp_manager ON employees(manager_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lr_employee ON leave_requests(employee_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lr_status ON leave_requests(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lr_type ON leave_requests(leave_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lr_requested ON leave_requests(requested_date DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lr_approver ON leave_requests(approved_by)")
+    
     conn.commit()
     conn.close()
 
-def get_db_connection():
-    """Get a database connection"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # This allows us to access columns by name
-    return conn
+# Connection pool shared by all tool calls
+_connection_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=POOL_SIZE)
+
+def init_connection_pool():
+    """Open the pooled database connections"""
+    for _ in range(POOL_SIZE):
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        apply_pragmas(conn)
+        conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+        _connection_pool.put(conn)
+
+@contextmanager
+def borrow_conn():
+    """Borrow a database connection from the pool"""
+    conn = _connection_pool.get()
+    try:
+        yield conn
+    finally:
+        # Don't hand an open transaction to the next borrower
+        if conn.in_transaction:
+            conn.rollback()
+        _connection_pool.put(conn)
 
 # Utility functions
-def serialize_date(obj):
-    """JSON serializer for date objects"""
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+def parse_date(value: str) -> date:
+    """Parse a YYYY-MM-DD date, raising ValueError if it isn't one"""
+    if _CANONICAL_DATE.fullmatch(value):
+        return date.fromisoformat(value)
+    # Non-padded input such as 2020-1-5 is still accepted; ISO week dates are not
+    return datetime.strptime(value, "%Y-%m-%d").date()
 
 def row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
     """Convert SQLite row to dictionary"""
     return dict(row)
 
-def get_employee_full_name(employee_id: int) -> str:
-    """Get employee's full name"""
-    if not employee_id:
-        return "Unknown Employee"
-        
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT first_name, last_name FROM employees WHERE id = ?", (employee_id,))
+@lru_cache
+def _row_cls(description: tuple) -> type:
+    """Build (once per result shape) a namedtuple class for a cursor description"""
+    return namedtuple("Row", [column[0] for column in description])
+
+def rows_to_dicts(cursor: sqlite3.Cursor, rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+    """Convert all rows fetched from a cursor to dictionaries"""
+    cls = _row_cls(cursor.description)
+    return [cls(*row)._asdict() for row in rows]
+
+def leave_request_update_error(cursor: sqlite3.Cursor, leave_request_id: int, approver_id: int) -> Dict[str, Any]:
+    """Explain why a guarded approve/reject UPDATE matched no row"""
+    cursor.execute('''
+        SELECT (SELECT status FROM leave_requests WHERE id = ?) AS status,
+               EXISTS (SELECT 1 FROM employees WHERE id = ?) AS approver_exists
+    ''', (leave_request_id, approver_id))
     row = cursor.fetchone()
-    conn.close()
     
-    if row:
-        return f"{row['first_name']} {row['last_name']}"
-    return "Unknown Employee"
+    if row['status'] is None:
+        return {"error": f"Leave request with ID {leave_request_id} not found"}
+    if not row['approver_exists']:
+        return {"error": f"Approver with ID {approver_id} not found"}
+    return {"error": f"Leave request is already {row['status']}"}
+
+@lru_cache
+def employee_update_sql(fields: FrozenSet[str]) -> Tuple[str, Tuple[str, ...]]:
+    """Build the UPDATE statement for a set of employee fields and the order to bind them in"""
+    field_order = tuple(field for field in EMPLOYEE_UPDATE_FIELDS if field in fields)
+    assignments = ", ".join(f"{field} = ?" for field in field_order)
+    return f"UPDATE employees SET {assignments} WHERE id = ? RETURNING *", field_order
 
 # Employee Management Tools
 @mcp.tool()
@@ -153,89 +277,102 @@ def create_employee(
 ) -> Dict[str, Any]:
     """Create a new employee record"""
     try:
-        hire_date_obj = datetime.strptime(hire_date, "%Y-%m-%d").date()
+        hire_date_obj = parse_date(hire_date)
     except ValueError:
         return {"error": "Invalid hire_date format. Use YYYY-MM-DD"}
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Validate manager exists if provided
-    if manager_id:
-        cursor.execute("SELECT id FROM employees WHERE id = ?", (manager_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return {"error": f"Manager with ID {manager_id} does not exist"}
+    # 0 means "no manager", as in update_employee
+    manager_id = manager_id or None
     
-    try:
-        cursor.execute('''
-            INSERT INTO employees (first_name, last_name, email, department, position, hire_date, manager_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (first_name, last_name, email, department, position, hire_date_obj.isoformat(), manager_id))
-        
-        employee_id = cursor.lastrowid
-        conn.commit()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
         
-        # Get the created employee
-        cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-        employee_row = cursor.fetchone()
-        conn.close()
-        
-        return {
-            "message": f"Employee {first_name} {last_name} created successfully",
-            "employee_id": employee_id,
-            "employee": row_to_dict(employee_row)
-        }
-    except sqlite3.IntegrityError as e:
-        conn.close()
-        return {"error": f"Database error: {str(e)}"}
+        # The manager_id foreign key is enforced by SQLite, no pre-check needed
+        try:
+            cursor.execute('''
+                INSERT INTO employees (first_name, last_name, email, department, position, hire_date, manager_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                RETURNING *
+            ''', (first_name, last_name, email, department, position, hire_date_obj.isoformat(), manager_id))
+            employee_row = cursor.fetchone()
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            if e.sqlite_errorname == "SQLITE_CONSTRAINT_FOREIGNKEY":
+                return {"error": f"Manager with ID {manager_id} does not exist"}
+            return {"error": f"Database error: {str(e)}"}
+    
+    return {
+        "message": f"Employee {first_name} {last_name} created successfully",
+        "employee_id": employee_row['id'],
+        "employee": row_to_dict(employee_row)
+    }
 
 @mcp.tool()
 def get_employee(employee_id: int) -> Dict[str, Any]:
     """Get employee details by ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-    employee_row = cursor.fetchone()
-    conn.close()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT e.*, m.first_name AS mgr_first, m.last_name AS mgr_last
+            FROM employees e
+            LEFT JOIN employees m ON m.id = e.manager_id
+            WHERE e.id = ?
+        ''', (employee_id,))
+        employee_row = cursor.fetchone()
     
     if not employee_row:
         return {"error": f"Employee with ID {employee_id} not found"}
     
     employee_data = row_to_dict(employee_row)
-    manager_name = get_employee_full_name(employee_data.get('manager_id'))
+    mgr_first = employee_data.pop('mgr_first')
+    mgr_last = employee_data.pop('mgr_last')
+    
+    manager_name = None
+    if employee_data.get('manager_id'):
+        manager_name = f"{mgr_first} {mgr_last}" if mgr_first is not None else "Unknown Employee"
     
     return {
         "employee": employee_data,
-        "manager_name": manager_name if employee_data.get('manager_id') else None
+        "manager_name": manager_name
     }
 
 @mcp.tool()
-def list_employees(department: Optional[str] = None, status: Optional[str] = None) -> Dict[str, Any]:
+def list_employees(
+    department: Optional[str] = None,
+    status: Optional[str] = None,
+    count_only: bool = False
+) -> Dict[str, Any]:
     """List all employees with optional filtering by department and status"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM employees WHERE 1=1"
+    filters = ""
     params = []
     
     if department:
-        query += " AND LOWER(department) = LOWER(?)"
+        filters += " AND e.department = ?"
         params.append(department)
     
     if status:
-        query += " AND status = ?"
+        filters += " AND e.status = ?"
         params.append(status)
     
-    cursor.execute(query, params)
-    employee_rows = cursor.fetchall()
-    conn.close()
-    
-    employees_list = []
-    for row in employee_rows:
-        emp_data = row_to_dict(row)
-        emp_data["manager_name"] = get_employee_full_name(emp_data.get('manager_id'))
-        employees_list.append(emp_data)
+    if count_only:
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM employees e WHERE 1=1" + filters, params)
+            return {"count": cursor.fetchone()[0]}
+    
+    # Resolve manager names in the same query instead of one lookup per row
+    query = """
+        SELECT e.*,
+               COALESCE(m.first_name || ' ' || m.last_name, 'Unknown Employee') AS manager_name
+        FROM employees e
+        LEFT JOIN employees m ON m.id = e.manager_id
+        WHERE 1=1
+    """ + filters
+    
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        employees_list = rows_to_dicts(cursor, cursor.fetchall())
     
     return {
         "count": len(employees_list),
@@ -254,77 +391,65 @@ def update_employee(
     manager_id: Optional[int] = None
 ) -> Dict[str, Any]:
     """Update employee information"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if employee exists
-    cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return {"error": f"Employee with ID {employee_id} not found"}
-    
-    # Validate status if provided
-    if status and status not in [s.value for s in EmployeeStatus]:
-        conn.close()
-        return {"error": f"Invalid status. Must be one of: {[s.value for s in EmployeeStatus]}"}
-    
-    # Validate manager if provided
-    if manager_id is not None and manager_id != 0:
-        cursor.execute("SELECT id FROM employees WHERE id = ?", (manager_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return {"error": f"Manager with ID {manager_id} does not exist"}
-    
-    # Build update query
-    update_fields = []
-    params = []
-    
-    if first_name:
-        update_fields.append("first_name = ?")
-        params.append(first_name)
-    if last_name:
-        update_fields.append("last_name = ?")
-        params.append(last_name)
-    if email:
-        update_fields.append("email = ?")
-        params.append(email)
-    if department:
-        update_fields.append("department = ?")
-        params.append(department)
-    if position:
-        update_fields.append("position = ?")
-        params.append(position)
-    if status:
-        update_fields.append("status = ?")
-        params.append(status)
-    if manager_id is not None:
-        update_fields.append("manager_id = ?")
-        params.append(manager_id if manager_id != 0 else None)
-    
-    if not update_fields:
-        conn.close()
-        return {"error": "No fields to update"}
-    
-    params.append(employee_id)
-    query = f"UPDATE employees SET {', '.join(update_fields)} WHERE id = ?"
-    
-    try:
-        cursor.execute(query, params)
-        conn.commit()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
         
-        # Get updated employee
-        cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-        updated_employee = cursor.fetchone()
-        conn.close()
+        # Collect the fields to update
+        updates = {}
         
-        emp_data = row_to_dict(updated_employee)
-        return {
-            "message": f"Employee {emp_data['first_name']} {emp_data['last_name']} updated successfully",
-            "employee": emp_data
-        }
-    except sqlite3.IntegrityError as e:
-        conn.close()
-        return {"error": f"Database error: {str(e)}"}
+        if first_name:
+            updates["first_name"] = first_name
+        if last_name:
+            updates["last_name"] = last_name
+        if email:
+            updates["email"] = email
+        if department:
+            updates["department"] = department
+        if position:
+            updates["position"] = position
+        if status:
+            updates["status"] = status
+        if manager_id is not None:
+            updates["manager_id"] = manager_id if manager_id != 0 else None
+        
+        # Validate status and manager if provided
+        validation_error = None
+        if status and status not in _EMPLOYEE_STATUS_VALUES:
+            validation_error = {"error": f"Invalid status. Must be one of: {_EMPLOYEE_STATUS_CHOICES}"}
+        elif manager_id is not None and manager_id != 0:
+            cursor.execute("SELECT id FROM employees WHERE id = ?", (manager_id,))
+            if not cursor.fetchone():
+                validation_error = {"error": f"Manager with ID {manager_id} does not exist"}
+        if not validation_error and not updates:
+            validation_error = {"error": "No fields to update"}
+        
+        if validation_error:
+            # A missing employee is reported ahead of any other error
+            cursor.execute("SELECT 1 FROM employees WHERE id = ?", (employee_id,))
+            if not cursor.fetchone():
+                return {"error": f"Employee with ID {employee_id} not found"}
+            return validation_error
+        
+        query, field_order = employee_update_sql(frozenset(updates))
+        params = [updates[field] for field in field_order]
+        params.append(employee_id)
+        
+        try:
+            cursor.execute(query, params)
+            updated_employee = cursor.fetchone()
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            return {"error": f"Database error: {str(e)}"}
+    
+    # No row updated means the employee doesn't exist
+    if not updated_employee:
+        return {"error": f"Employee with ID {employee_id} not found"}
+    
+    emp_data = row_to_dict(updated_employee)
+    return {
+        "message": f"Employee {emp_data['first_name']} {emp_data['last_name']} updated successfully",
+        "employee": emp_data
+    }
 
 # Leave Management Tools
 @mcp.tool()
@@ -336,61 +461,52 @@ def submit_leave_request(
     reason: str
 ) -> Dict[str, Any]:
     """Submit a new leave request"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if employee exists
-    cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-    employee_row = cursor.fetchone()
-    if not employee_row:
-        conn.close()
-        return {"error": f"Employee with ID {employee_id} not found"}
-    
-    try:
-        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-    except ValueError:
-        conn.close()
-        return {"error": "Invalid date format. Use YYYY-MM-DD"}
-    
-    if start_date_obj > end_date_obj:
-        conn.close()
-        return {"error": "Start date cannot be after end date"}
-    
-    if leave_type not in [lt.value for lt in LeaveType]:
-        conn.close()
-        return {"error": f"Invalid leave type. Must be one of: {[lt.value for lt in LeaveType]}"}
-    
-    # Calculate days requested
-    days_requested = (end_date_obj - start_date_obj).days + 1
-    
-    # Check leave balance
-    employee_data = row_to_dict(employee_row)
-    if leave_type == LeaveType.ANNUAL.value and days_requested > employee_data['annual_leave_balance']:
-        conn.close()
-        return {"error": f"Insufficient annual leave balance. Available: {employee_data['annual_leave_balance']} days"}
-    elif leave_type == LeaveType.SICK.value and days_requested > employee_data['sick_leave_balance']:
-        conn.close()
-        return {"error": f"Insufficient sick leave balance. Available: {employee_data['sick_leave_balance']} days"}
-    
-    # Insert leave request
-    cursor.execute('''
-        INSERT INTO leave_requests (employee_id, leave_type, start_date, end_date, days_requested, reason, requested_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (employee_id, leave_type, start_date_obj.isoformat(), end_date_obj.isoformat(), 
-          days_requested, reason, datetime.now().isoformat()))
-    
-    leave_request_id = cursor.lastrowid
-    conn.commit()
-    
-    # Get the created leave request
-    cursor.execute("SELECT * FROM leave_requests WHERE id = ?", (leave_request_id,))
-    leave_request_row = cursor.fetchone()
-    conn.close()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        
+        # Check if employee exists, reading only the balances needed below
+        cursor.execute(
+            "SELECT annual_leave_balance, sick_leave_balance FROM employees WHERE id = ?",
+            (employee_id,)
+        )
+        employee_row = cursor.fetchone()
+        if not employee_row:
+            return {"error": f"Employee with ID {employee_id} not found"}
+        
+        try:
+            start_date_obj = parse_date(start_date)
+            end_date_obj = parse_date(end_date)
+        except ValueError:
+            return {"error": "Invalid date format. Use YYYY-MM-DD"}
+        
+        if start_date_obj > end_date_obj:
+            return {"error": "Start date cannot be after end date"}
+        
+        if leave_type not in _LEAVE_TYPE_VALUES:
+            return {"error": f"Invalid leave type. Must be one of: {_LEAVE_TYPE_CHOICES}"}
+        
+        # Calculate days requested
+        days_requested = (end_date_obj - start_date_obj).days + 1
+        
+        # Check leave balance
+        if leave_type == LeaveType.ANNUAL.value and days_requested > employee_row['annual_leave_balance']:
+            return {"error": f"Insufficient annual leave balance. Available: {employee_row['annual_leave_balance']} days"}
+        elif leave_type == LeaveType.SICK.value and days_requested > employee_row['sick_leave_balance']:
+            return {"error": f"Insufficient sick leave balance. Available: {employee_row['sick_leave_balance']} days"}
+        
+        # Insert leave request
+        cursor.execute('''
+            INSERT INTO leave_requests (employee_id, leave_type, start_date, end_date, days_requested, reason, requested_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            RETURNING *
+        ''', (employee_id, leave_type, start_date_obj.isoformat(), end_date_obj.isoformat(),
+              days_requested, reason, datetime.now().isoformat()))
+        leave_request_row = cursor.fetchone()
+        conn.commit()
     
     return {
         "message": "Leave request submitted successfully",
-        "leave_request_id": leave_request_id,
+        "leave_request_id": leave_request_row['id'],
         "leave_request": row_to_dict(leave_request_row)
     }
 
@@ -401,54 +517,30 @@ def approve_leave_request(
     comments: Optional[str] = None
 ) -> Dict[str, Any]:
     """Approve a leave request"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if leave request exists
-    cursor.execute("SELECT * FROM leave_requests WHERE id = ?", (leave_request_id,))
-    leave_request_row = cursor.fetchone()
-    if not leave_request_row:
-        conn.close()
-        return {"error": f"Leave request with ID {leave_request_id} not found"}
-    
-    # Check if approver exists
-    cursor.execute("SELECT id FROM employees WHERE id = ?", (approver_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return {"error": f"Approver with ID {approver_id} not found"}
+    now_iso = datetime.now().isoformat()
     
-    leave_request_data = row_to_dict(leave_request_row)
-    if leave_request_data['status'] != LeaveStatus.PENDING.value:
-        conn.close()
-        return {"error": f"Leave request is already {leave_request_data['status']}"}
-    
-    # Update leave request
-    cursor.execute('''
-        UPDATE leave_requests 
-        SET status = ?, approved_by = ?, approved_date = ?, comments = ?
-        WHERE id = ?
-    ''', (LeaveStatus.APPROVED.value, approver_id, datetime.now().isoformat(), comments, leave_request_id))
-    
-    # Deduct from employee's leave balance
-    if leave_request_data['leave_type'] == LeaveType.ANNUAL.value:
-        cursor.execute('''
-            UPDATE employees 
-            SET annual_leave_balance = annual_leave_balance - ?
-            WHERE id = ?
-        ''', (leave_request_data['days_requested'], leave_request_data['employee_id']))
-    elif leave_request_data['leave_type'] == LeaveType.SICK.value:
-        cursor.execute('''
-            UPDATE employees 
-            SET sick_leave_balance = sick_leave_balance - ?
-            WHERE id = ?
-        ''', (leave_request_data['days_requested'], leave_request_data['employee_id']))
-    
-    conn.commit()
-    
-    # Get updated leave request
-    cursor.execute("SELECT * FROM leave_requests WHERE id = ?", (leave_request_id,))
-    updated_leave_request = cursor.fetchone()
-    conn.close()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        
+        # The status change and the balance deduction commit as one transaction
+        with conn:
+            # Update leave request
+            cursor.execute(DECIDE_LEAVE_REQUEST_SQL, (
+                LeaveStatus.APPROVED.value, approver_id, now_iso, comments,
+                leave_request_id, LeaveStatus.PENDING.value, approver_id
+            ))
+            updated_leave_request = cursor.fetchone()
+            if not updated_leave_request:
+                return leave_request_update_error(cursor, leave_request_id, approver_id)
+            
+            # Deduct from employee's leave balance
+            leave_type = updated_leave_request['leave_type']
+            if leave_type in (LeaveType.ANNUAL.value, LeaveType.SICK.value):
+                cursor.execute(DEDUCT_LEAVE_BALANCE_SQL, {
+                    "leave_type": leave_type,
+                    "days": updated_leave_request['days_requested'],
+                    "employee_id": updated_leave_request['employee_id']
+                })
     
     return {
         "message": "Leave request approved successfully",
@@ -462,40 +554,21 @@ def reject_leave_request(
     comments: str
 ) -> Dict[str, Any]:
     """Reject a leave request"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Check if leave request exists
-    cursor.execute("SELECT * FROM leave_requests WHERE id = ?", (leave_request_id,))
-    leave_request_row = cursor.fetchone()
-    if not leave_request_row:
-        conn.close()
-        return {"error": f"Leave request with ID {leave_request_id} not found"}
+    now_iso = datetime.now().isoformat()
     
-    # Check if approver exists
-    cursor.execute("SELECT id FROM employees WHERE id = ?", (approver_id,))
-    if not cursor.fetchone():
-        conn.close()
-        return {"error": f"Approver with ID {approver_id} not found"}
-    
-    leave_request_data = row_to_dict(leave_request_row)
-    if leave_request_data['status'] != LeaveStatus.PENDING.value:
-        conn.close()
-        return {"error": f"Leave request is already {leave_request_data['status']}"}
-    
-    # Update leave request
-    cursor.execute('''
-        UPDATE leave_requests 
-        SET status = ?, approved_by = ?, approved_date = ?, comments = ?
-        WHERE id = ?
-    ''', (LeaveStatus.REJECTED.value, approver_id, datetime.now().isoformat(), comments, leave_request_id))
-    
-    conn.commit()
-    
-    # Get updated leave request
-    cursor.execute("SELECT * FROM leave_requests WHERE id = ?", (leave_request_id,))
-    updated_leave_request = cursor.fetchone()
-    conn.close()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        
+        # Update leave request
+        cursor.execute(DECIDE_LEAVE_REQUEST_SQL, (
+            LeaveStatus.REJECTED.value, approver_id, now_iso, comments,
+            leave_request_id, LeaveStatus.PENDING.value, approver_id
+        ))
+        updated_leave_request = cursor.fetchone()
+        if not updated_leave_request:
+            return leave_request_update_error(cursor, leave_request_id, approver_id)
+        
+        conn.commit()
     
     return {
         "message": "Leave request rejected",
@@ -506,39 +579,46 @@ def reject_leave_request(
 def get_leave_requests(
     employee_id: Optional[int] = None,
     status: Optional[str] = None,
-    leave_type: Optional[str] = None
+    leave_type: Optional[str] = None,
+    count_only: bool = False
 ) -> Dict[str, Any]:
     """Get leave requests with optional filtering"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM leave_requests WHERE 1=1"
+    filters = ""
     params = []
     
     if employee_id:
-        query += " AND employee_id = ?"
+        filters += " AND lr.employee_id = ?"
         params.append(employee_id)
     
     if status:
-        query += " AND status = ?"
+        filters += " AND lr.status = ?"
         params.append(status)
     
     if leave_type:
-        query += " AND leave_type = ?"
+        filters += " AND lr.leave_type = ?"
         params.append(leave_type)
     
-    query += " ORDER BY requested_date DESC"
-    
-    cursor.execute(query, params)
-    leave_request_rows = cursor.fetchall()
-    conn.close()
-    
-    leave_requests_list = []
-    for row in leave_request_rows:
-        req_data = row_to_dict(row)
-        req_data["employee_name"] = get_employee_full_name(req_data['employee_id'])
-        req_data["approved_by_name"] = get_employee_full_name(req_data.get('approved_by'))
-        leave_requests_list.append(req_data)
+    if count_only:
+        with borrow_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM leave_requests lr WHERE 1=1" + filters, params)
+            return {"count": cursor.fetchone()[0]}
+    
+    # Resolve employee and approver names in the same query instead of per row
+    query = """
+        SELECT lr.*,
+               COALESCE(emp.first_name || ' ' || emp.last_name, 'Unknown Employee') AS employee_name,
+               COALESCE(app.first_name || ' ' || app.last_name, 'Unknown Employee') AS approved_by_name
+        FROM leave_requests lr
+        LEFT JOIN employees emp ON emp.id = lr.employee_id
+        LEFT JOIN employees app ON app.id = lr.approved_by
+        WHERE 1=1
+    """ + filters + " ORDER BY lr.requested_date DESC"
+    
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        leave_requests_list = rows_to_dicts(cursor, cursor.fetchall())
     
     return {
         "count": len(leave_requests_list),
@@ -548,30 +628,33 @@ def get_leave_requests(
 @mcp.tool()
 def get_employee_leave_balance(employee_id: int) -> Dict[str, Any]:
     """Get employee's current leave balance"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM employees WHERE id = ?", (employee_id,))
-    employee_row = cursor.fetchone()
-    conn.close()
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT first_name, last_name, annual_leave_balance, sick_leave_balance
+            FROM employees WHERE id = ?
+        ''', (employee_id,))
+        employee_row = cursor.fetchone()
     
     if not employee_row:
         return {"error": f"Employee with ID {employee_id} not found"}
     
-    employee_data = row_to_dict(employee_row)
     return {
-        "employee_name": f"{employee_data['first_name']} {employee_data['last_name']}",
-        "annual_leave_balance": employee_data['annual_leave_balance'],
-        "sick_leave_balance": employee_data['sick_leave_balance']
+        "employee_name": f"{employee_row['first_name']} {employee_row['last_name']}",
+        "annual_leave_balance": employee_row['annual_leave_balance'],
+        "sick_leave_balance": employee_row['sick_leave_balance']
     }
 
 # Resources
+# Tool results only hold SQLite values (dates are stored as ISO strings),
+# so json.dumps needs no default= hook for them
 @mcp.resource("employee://{employee_id}")
 def get_employee_resource(employee_id: str) -> str:
     """Get employee information as a resource"""
     try:
         emp_id = int(employee_id)
         result = get_employee(emp_id)
-        return json.dumps(result, indent=2, default=serialize_date)
+        return json.dumps(result, indent=2)
     except ValueError:
         return json.dumps({"error": "Invalid employee ID"})
 
@@ -579,13 +662,19 @@ def get_employee_resource(employee_id: str) -> str:
 def get_pending_leave_requests() -> str:
     """Get all pending leave requests"""
     result = get_leave_requests(status="pending")
-    return json.dumps(result, indent=2, default=serialize_date)
+    return json.dumps(result, indent=2)
+
+@mcp.resource("leave-requests://pending/count")
+def get_pending_leave_request_count() -> str:
+    """Get the number of pending leave requests without fetching them"""
+    result = get_leave_requests(status="pending", count_only=True)
+    return json.dumps(result, indent=2)
 
 @mcp.resource("department://{department_name}")
 def get_department_employees(department_name: str) -> str:
     """Get all employees in a specific department"""
     result = list_employees(department=department_name)
-    return json.dumps(result, indent=2, default=serialize_date)
+    return json.dumps(result, indent=2)
 
 # Demo data function
 @mcp.tool()
@@ -607,31 +696,65 @@ def load_demo_data() -> Dict[str, Any]:
         }
     ]
     
-    created_employees = []
-    for emp_data in demo_employees:
-        result = create_employee(**emp_data)
-        if "error" not in result:
-            created_employees.append(result)
-    
-    # Create demo leave requests
-    leave_requests_created = 0
-    if created_employees:
-        result1 = submit_leave_request(1, "annual", "2025-07-01", "2025-07-05", "Summer vacation")
-        if "error" not in result1:
-            leave_requests_created += 1
+    demo_leave_requests = [
+        {
+            "email": "john.doe@company.com", "leave_type": "annual",
+            "start_date": "2025-07-01", "end_date": "2025-07-05", "reason": "Summer vacation"
+        },
+        {
+            "email": "jane.smith@company.com", "leave_type": "sick",
+            "start_date": "2025-06-25", "end_date": "2025-06-26", "reason": "Doctor appointment"
+        }
+    ]
+    
+    # Insert everything in one transaction; demo rows are known-valid, so skip
+    # the per-row validation done by create_employee/submit_leave_request
+    with borrow_conn() as conn:
+        cursor = conn.cursor()
+        # Only insert employees not loaded yet, so repeat calls don't burn AUTOINCREMENT ids
+        cursor.executemany('''
+            INSERT INTO employees (first_name, last_name, email, department, position, hire_date)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM employees WHERE email = ?)
+        ''', [(emp["first_name"], emp["last_name"], emp["email"], emp["department"],
+               emp["position"], emp["hire_date"], emp["email"]) for emp in demo_employees])
+        employees_created = cursor.rowcount
         
-        result2 = submit_leave_request(2, "sick", "2025-06-25", "2025-06-26", "Doctor appointment")
-        if "error" not in result2:
-            leave_requests_created += 1
+        # Create demo leave requests
+        leave_requests_created = 0
+        if employees_created:
+            emails = [req["email"] for req in demo_leave_requests]
+            cursor.execute(
+                f"SELECT id, email FROM employees WHERE email IN ({', '.join('?' * len(emails))})",
+                emails
+            )
+            employee_ids = {row["email"]: row["id"] for row in cursor.fetchall()}
+            
+            leave_rows = []
+            for req in demo_leave_requests:
+                start_date_obj = date.fromisoformat(req["start_date"])
+                end_date_obj = date.fromisoformat(req["end_date"])
+                leave_rows.append((
+                    employee_ids[req["email"]], req["leave_type"], req["start_date"], req["end_date"],
+                    (end_date_obj - start_date_obj).days + 1, req["reason"], datetime.now().isoformat()
+                ))
+            cursor.executemany('''
+                INSERT INTO leave_requests (employee_id, leave_type, start_date, end_date, days_requested, reason, requested_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', leave_rows)
+            leave_requests_created = cursor.rowcount
+        
+        conn.commit()
     
     return {
         "message": "Demo data loaded successfully",
-        "employees_created": len(created_employees),
+        "employees_created": employees_created,
         "leave_requests_created": leave_requests_created
     }
 
-# Initialize database on startup
+# Initialize database and connection pool on startup
 init_database()
+init_connection_pool()
 
 if __name__ == "__main__":
     # Run the server